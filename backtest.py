@@ -0,0 +1,336 @@
+# 回测计算模块：行情下载 / 持久化、指标与信号计算、图表渲染；Streamlit 页面见 High_Close_Ratio.py
+import streamlit as st
+import yfinance as yf
+import pandas as pd
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # 无界面后端，直接渲染为 PNG
+import matplotlib.pyplot as plt
+import io  # 用于图表 PNG 缓冲
+
+try:
+    from numba import njit  # 可选：安装 numba 后用 JIT 编译信号计算
+except ImportError:
+    njit = None
+
+try:
+    import duckdb  # 可选：安装 duckdb 后在本地持久化历史行情
+except ImportError:
+    duckdb = None
+
+
+# 本地持久化：DuckDB 文件中按 (代码, 间隔, 时间) 保存行情，跨会话复用
+PRICE_DB_PATH = "prices.duckdb"
+PRICE_COLUMNS = {'Open': 'open', 'High': 'high', 'Low': 'low', 'Close': 'close', 'Adj Close': 'adj_close', 'Volume': 'volume'}
+PERIOD_OFFSETS = {
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2),
+    "5y": pd.DateOffset(years=5),
+    "10y": pd.DateOffset(years=10),
+}
+# 已存数据的第一根 K 线允许晚于区间起点的天数（周末、节假日、月/季线对齐）
+START_TOLERANCE = {
+    "1d": pd.Timedelta(days=7),
+    "5d": pd.Timedelta(days=10),
+    "1wk": pd.Timedelta(days=10),
+    "1mo": pd.Timedelta(days=35),
+    "3mo": pd.Timedelta(days=95),
+}
+
+
+@st.cache_resource
+def get_price_db():
+    if duckdb is None:
+        return None
+    con = duckdb.connect(PRICE_DB_PATH)
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS prices("
+        "ticker VARCHAR, interval VARCHAR, ts TIMESTAMP, "
+        "open DOUBLE, high DOUBLE, low DOUBLE, close DOUBLE, adj_close DOUBLE, volume DOUBLE, "
+        "PRIMARY KEY(ticker, interval, ts))"
+    )
+    return con
+
+
+def _download(tickers, **kwargs):
+    return yf.download(tickers, group_by="ticker", auto_adjust=False, progress=False, threads=True, **kwargs)
+
+
+# 从批量下载结果中取出单只股票，并扁平化列名（取字段层）、移除重复列
+def select_ticker(data, ticker):
+    if isinstance(data.columns, pd.MultiIndex) and ticker in data.columns.get_level_values(0):
+        data = data[ticker]
+    if isinstance(data.columns, pd.MultiIndex):
+        data = data.set_axis(data.columns.get_level_values(0), axis=1)
+    return data.loc[:, ~data.columns.duplicated()].dropna(how="all")
+
+
+def _naive_index(index):
+    return index.tz_localize(None) if index.tz is not None else index
+
+
+def _store_prices(con, data, tickers, interval):
+    for t in tickers:
+        sub = select_ticker(data, t)
+        if sub.empty or not all(col in sub.columns for col in PRICE_COLUMNS):
+            continue
+        ts = _naive_index(sub.index)
+        frame = sub[list(PRICE_COLUMNS)].rename(columns=PRICE_COLUMNS)
+        frame.insert(0, 'ts', ts)
+        frame.insert(0, 'interval', interval)
+        frame.insert(0, 'ticker', t)
+        con.register('newdf', frame.reset_index(drop=True))
+        # 最后一根 K 线可能在盘中被更新，因此用 REPLACE 而不是 IGNORE
+        con.execute(
+            "INSERT OR REPLACE INTO prices "
+            "SELECT ticker, interval, ts, open, high, low, close, adj_close, volume FROM newdf"
+        )
+        con.unregister('newdf')
+
+
+def _read_prices(con, ticker, interval, start):
+    df = con.execute(
+        "SELECT ts, open, high, low, close, adj_close, volume FROM prices "
+        "WHERE ticker = ? AND interval = ? AND ts >= ? ORDER BY ts",
+        [ticker, interval, start],
+    ).fetch_df()
+    df = df.set_index('ts').rename(columns={v: k for k, v in PRICE_COLUMNS.items()})
+    df.index.name = 'Date'
+    return df
+
+
+# 增量下载中重新取到的参考 K 线是否与库中一致；拆股 / 分红后 Yahoo 会整体重算 Close / Adj Close，
+# 此时库中历史已失效，需要整段重新下载
+def _matches_stored(data, ticker, ref):
+    ref_ts, ref_close, ref_adj_close = ref
+    sub = select_ticker(data, ticker)
+    if sub.empty or 'Close' not in sub.columns or 'Adj Close' not in sub.columns:
+        return False
+    sub = sub.set_axis(_naive_index(sub.index))
+    ref_ts = pd.Timestamp(ref_ts)
+    if ref_ts not in sub.index:
+        return False
+    row = sub.loc[ref_ts]
+    return bool(np.isclose(row['Close'], ref_close, rtol=1e-6) and np.isclose(row['Adj Close'], ref_adj_close, rtol=1e-6))
+
+
+# 缓存下载结果：参数不变时重复回测直接读取缓存，避免重复网络请求
+# 安装 duckdb 时，本地已覆盖区间起点的股票只增量下载最新的 K 线；若已存 K 线被重新复权则整段重新下载
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_prices(ticker: str, period: str, interval: str) -> pd.DataFrame:
+    # ticker 可为空格分隔的多个代码，yfinance 会合并为一次批量请求
+    db = get_price_db()
+    if db is None:
+        return _download(ticker, period=period, interval=interval)
+
+    con = db.cursor()
+    tickers = ticker.split()
+    start = pd.Timestamp.now().normalize() - PERIOD_OFFSETS[period]
+    full, incremental, tail_start = [], {}, None
+    for t in tickers:
+        first = con.execute(
+            "SELECT min(ts) FROM prices WHERE ticker = ? AND interval = ?", [t, interval]
+        ).fetchone()[0]
+        if first is None or pd.Timestamp(first) > start + START_TOLERANCE[interval]:
+            full.append(t)
+            continue
+        # 参考 K 线取倒数第二根：最后一根可能是盘中未完成的 K 线，数值变化属正常
+        rows = con.execute(
+            "SELECT ts, close, adj_close FROM prices WHERE ticker = ? AND interval = ? ORDER BY ts DESC LIMIT 2",
+            [t, interval],
+        ).fetchall()
+        incremental[t] = rows[-1]
+        ref_ts = pd.Timestamp(rows[-1][0])
+        tail_start = min(tail_start, ref_ts) if tail_start is not None else ref_ts
+
+    if incremental:
+        tail = _download(" ".join(incremental), start=tail_start.strftime("%Y-%m-%d"), interval=interval)
+        readjusted = [t for t, ref in incremental.items() if not _matches_stored(tail, t, ref)]
+        for t in readjusted:
+            con.execute("DELETE FROM prices WHERE ticker = ? AND interval = ?", [t, interval])
+        _store_prices(con, tail, [t for t in incremental if t not in readjusted], interval)
+        full += readjusted
+    if full:
+        _store_prices(con, _download(" ".join(full), period=period, interval=interval), full, interval)
+
+    return pd.concat({t: _read_prices(con, t, interval, start) for t in tickers}, axis=1)
+
+
+# CSV 下载内容：直接编码为 bytes（不缓存，保证与页面上的数据一致；几千行的 to_csv 开销很小）
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=True).encode('utf-8')
+
+
+# 价格走势图 + 信号标记：渲染为 PNG bytes 并缓存；数组以 bytes 形式传入以便哈希
+@st.cache_data(show_spinner=False)
+def render_chart(ticker, period, sma_period, dates_bytes, close_bytes, sma_bytes, sig_dates_bytes, sig_close_bytes) -> bytes:
+    dates = np.frombuffer(dates_bytes, dtype=np.int64).view('datetime64[ns]')
+    close = np.frombuffer(close_bytes, dtype=np.float64)
+    sma = np.frombuffer(sma_bytes, dtype=np.float64)
+    sig_dates = np.frombuffer(sig_dates_bytes, dtype=np.int64).view('datetime64[ns]')
+    sig_close = np.frombuffer(sig_close_bytes, dtype=np.float64)
+
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot(dates, close, label='收盘价', color='blue')
+    ax.plot(dates, sma, label=f'SMA{sma_period}', color='orange')
+
+    # 标记信号日子
+    ax.scatter(sig_dates, sig_close, color='green', marker='^', s=100, label='买入信号')
+
+    ax.set_title(f"{ticker} 价格走势 (信号: 强势趋势 + 放量高收, 范围: {period})")
+    ax.set_xlabel("日期")
+    ax.set_ylabel("价格")
+    ax.legend()
+    ax.grid(True)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=90)
+    plt.close(fig)
+    return buf.getvalue()
+
+
+# 时间索引统一转换为 datetime64[ns] 再序列化（DuckDB 读回的索引可能是 us 精度）
+def _index_bytes(index) -> bytes:
+    return index.to_numpy(dtype='datetime64[ns]').view('i8').tobytes()
+
+
+# 将 DataFrame / 数组转换为 bytes 后调用缓存的 render_chart
+def render(data, signals, sma, ticker, period, sma_period) -> bytes:
+    return render_chart(
+        ticker, period, sma_period,
+        _index_bytes(data.index),
+        data['Close'].to_numpy(dtype=np.float64).tobytes(),
+        sma.astype(np.float64).tobytes(),
+        _index_bytes(signals.index),
+        signals['Close'].to_numpy(dtype=np.float64).tobytes(),
+    )
+
+
+# 简单移动平均：累加和相减，一次遍历 O(n)；前 w-1 个位置为 NaN（与 rolling().mean() 一致）
+# 窗口内含 NaN 时结果为 NaN，NaN 移出窗口后恢复；累加和结果均为 float64，与 numba 内核的 SMA 精度一致
+def _sma(arr: np.ndarray, w: int) -> np.ndarray:
+    nan = np.isnan(arr)
+    c = np.zeros(arr.size + 1)
+    np.cumsum(np.where(nan, 0, arr), dtype=np.float64, out=c[1:])
+    k = np.zeros(arr.size + 1, dtype=np.int64)
+    np.cumsum(nan, out=k[1:])
+    out = np.full(arr.size, np.nan)
+    out[w - 1:] = np.where(k[w:] - k[:-w] > 0, np.nan, (c[w:] - c[:-w]) / w)
+    return out
+
+
+# 安全除法：分母 <= 0（如均量预热期的 0、最高价为 0）时结果为 0，不产生 inf 和 RuntimeWarning
+# 统一在 float64 中计算，与 numba 内核逐元素的比值完全相同（阈值恰好落在边界时判定一致）
+def _safe_divide(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    return np.divide(num.astype(np.float64, copy=False), den.astype(np.float64, copy=False),
+                     out=np.zeros(num.shape), where=den > 0)
+
+
+# 单次线性遍历：滚动求和（加新减旧）得到 SMA / 均量，同时判定信号并计算下一个交易日回报
+# 预热期内 SMA、均量按 0 处理；窗口内含 NaN 时同样按 0 处理，NaN 移出窗口后恢复（与 rolling().mean() 一致）
+# 均量或最高价为 0 时比值按 0 处理（不触发信号）；收盘价 <= 0 时回报为 NaN
+# 比值与 SMA 比较均在 float64 中按 numpy 实现相同的方式计算（先除后比），边界上的判定与 numpy 实现一致
+def _compute_signals_loop(close, high, vol, w_sma, w_vol, hcr_thr, vmul):
+    n = close.size
+    out_sig = np.zeros(n, np.bool_)
+    out_ret = np.full(n, np.nan)
+    out_sma = np.zeros(n)
+    out_avg = np.zeros(n)
+    s_close = 0.0
+    s_vol = 0.0
+    nan_close = 0
+    nan_vol = 0
+    for i in range(n):
+        if np.isnan(close[i]):
+            nan_close += 1
+        else:
+            s_close += close[i]
+        if np.isnan(vol[i]):
+            nan_vol += 1
+        else:
+            s_vol += vol[i]
+        if i >= w_sma:
+            if np.isnan(close[i - w_sma]):
+                nan_close -= 1
+            else:
+                s_close -= close[i - w_sma]
+        if i >= w_vol:
+            if np.isnan(vol[i - w_vol]):
+                nan_vol -= 1
+            else:
+                s_vol -= vol[i - w_vol]
+        if i >= w_sma - 1 and nan_close == 0:
+            out_sma[i] = s_close / w_sma
+        if i >= w_vol - 1 and nan_vol == 0:
+            out_avg[i] = s_vol / w_vol
+        c = np.float64(close[i])
+        h = np.float64(high[i])
+        v = np.float64(vol[i])
+        hcr = c / h if h > 0 else 0.0
+        vratio = v / out_avg[i] if out_avg[i] > 0 else 0.0
+        if c > out_sma[i] and hcr >= hcr_thr and vratio > vmul:
+            out_sig[i] = True
+        if i + 1 < n and close[i] > 0:
+            out_ret[i] = (close[i + 1] - close[i]) / close[i]
+    return out_sig, out_ret, out_sma, out_avg
+
+
+# numpy 实现：未安装 numba 时使用
+def _compute_signals_numpy(close, high, vol, w_sma, w_vol, hcr_thr, vmul):
+    sma = np.nan_to_num(_sma(close, w_sma), copy=False)
+    avg_vol = np.nan_to_num(_sma(vol, w_vol), copy=False)
+    hcr = _safe_divide(close, high)
+    vratio = _safe_divide(vol, avg_vol)
+    signal = (close > sma) & (hcr >= hcr_thr) & (vratio > vmul)
+    # 下一个交易日回报：直接对收盘价数组错位切片，最后一行没有下一个收盘价；收盘价 <= 0 时为 NaN
+    ret = np.full(close.size, np.nan)
+    np.divide(close[1:] - close[:-1], close[:-1], out=ret[:-1], where=close[:-1] > 0)
+    return signal, ret, sma, avg_vol
+
+
+# 内核输入统一标记为只读：pandas Copy-on-Write 下 to_numpy() 返回只读视图，发生类型转换时则返回可写副本，
+# 统一只读后 numba 只需一个特化版本（只读/可写在 numba 中是不同的数组类型）
+def _readonly(arr: np.ndarray) -> np.ndarray:
+    arr.setflags(write=False)
+    return arr
+
+
+# 导入时用小数组预先触发 JIT 编译，首次点击回测不再等待编译；cache=True 时后续进程直接读取磁盘缓存
+# 参数类型与实际调用一致（只读 float64 数组 + int 窗口 + float 阈值），确保命中同一个特化版本
+def _warmup_numba():
+    dummy = _readonly(np.ones(30, np.float64))
+    _signal_kernel(dummy, dummy, dummy, 20, 20, 0.98, 1.5)
+
+
+if njit is not None:
+    # error_model='numpy'：除零得到 inf / NaN 而不是抛出 ZeroDivisionError；不用 fastmath，NaN 判断才可靠
+    _signal_kernel = njit(cache=True, error_model='numpy')(_compute_signals_loop)
+    _warmup_numba()
+else:
+    _signal_kernel = _compute_signals_numpy
+
+
+# 单只股票的指标计算 + 信号：返回信号日子详情（只含信号行）和全长度 SMA（用于画图）
+# 优先级：numba 内核 > numpy
+def compute_signals(data, sma_period, high_close_threshold, volume_multiplier):
+    # 一次取出原始数组，全部在 numpy 中完成，不回写 data
+    # dtype 固定为 float64 且统一只读，numba 内核只需一个类型特化
+    close = _readonly(data['Close'].to_numpy(dtype=np.float64))
+    high = _readonly(data['High'].to_numpy(dtype=np.float64))
+    vol = _readonly(data['Volume'].to_numpy(dtype=np.float64))
+    signal, ret, sma, avg_vol = _signal_kernel(close, high, vol, sma_period, 20, high_close_threshold, volume_multiplier)
+
+    # 过滤信号日子：排除没有有效下一个交易日回报的行（最后一行、下一个收盘价缺失、收盘价 <= 0），再取整数索引
+    idx = np.flatnonzero(signal & ~np.isnan(ret))
+
+    # 比值等展示列只在信号行上计算，不生成全长度列
+    signals = pd.DataFrame({
+        'Close': close[idx],
+        'High_Close_Ratio': _safe_divide(close[idx], high[idx]),
+        'Volume_Ratio': _safe_divide(vol[idx], avg_vol[idx]),
+        'Next_Close': close[idx + 1],
+        'Return': ret[idx],
+        'Success': ret[idx] > 0,  # 下一个交易日上涨为成功
+    }, index=data.index[idx])
+    return signals, sma